@@ -2,23 +2,63 @@ from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 import os
 from werkzeug.utils import secure_filename
+import io
+import uuid
+import concurrent.futures
 import worker as worker
+import utils.visualization as visualization
+import utils.process_pool as process_pool
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+# Paths are resolved from this file, so the server can start from any directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 # Configure upload folder
-UPLOAD_FOLDER = 'uploads'
+UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['EXTRACTION_TIMEOUT'] = 60  # seconds to wait for upload feature extraction
 
 # Initialize worker agent
-cndpt_directory = "CNDPT-20250509T093006Z-1-001/CNDPT"
+cndpt_directory = os.path.join(BASE_DIR, "CNDPT-20250509T093006Z-1-001", "CNDPT")
 agent = worker.Worker(cndpt_directory)
 
+# Bounded pool for upload feature extraction, set up by serve.py in production mode
+extraction_pool = None
+
+def to_client_path(path):
+    """
+    Dataset path as sent to the front end: relative to the app directory, with forward slashes.
+    """
+    return os.path.relpath(path, BASE_DIR).replace('\\', '/')
+
+def from_client_path(filename):
+    """
+    Resolve a path received from the front end against the app directory.
+    """
+    return os.path.join(BASE_DIR, filename)
+
+def parse_filters(args):
+    """
+    Build search filters from query parameters, e.g.
+    ?category=How to speak&category=Buy happiness&clip=1&min_duration=2.5&sample_rate=16000
+    """
+    filters = {}
+    if args.getlist('category'):
+        filters['category'] = args.getlist('category')
+    for key in ('clip', 'sample_rate'):
+        if args.getlist(key):
+            filters[key] = [int(value) for value in args.getlist(key)]
+    for key in ('min_duration', 'max_duration'):
+        if key in args:
+            filters[key] = float(args[key])
+    return filters
+
 @app.route('/api/find-similar', methods=['POST'])
 def find_similar_files():
     if 'file' not in request.files:
@@ -27,19 +67,36 @@ def find_similar_files():
     file = request.files['file']
     if file.filename == '':
         return jsonify({'error': 'No file selected'}), 400
+
+    try:
+        filters = parse_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid filter: {str(e)}'}), 400
     
     if file:
-        filename = secure_filename(file.filename)
+        # Unique prefix so concurrent uploads with the same name don't collide
+        filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         file.save(filepath)
         
         try:
             # Find similar files
-            similar_files = agent.find_similar_files(filepath, 5)
+            if extraction_pool is not None:
+                # Extract in a separate process so server threads stay responsive
+                future = extraction_pool.submit(worker.extract_query_vector, cndpt_directory, filepath)
+                try:
+                    input_vector = future.result(timeout=app.config['EXTRACTION_TIMEOUT'])
+                except concurrent.futures.TimeoutError:
+                    # Drop it if still queued, a running job keeps its slot until it ends
+                    future.cancel()
+                    raise
+                similar_files = agent.find_similar_vector(input_vector, 5, filters)
+            else:
+                similar_files = agent.find_similar_files(filepath, 5, filters)
             
             # Normalize file paths to use forward slashes
             normalized_similar_files = [
-                [path.replace('\\', '/'), similarity]
+                [to_client_path(path), similarity]
                 for path, similarity in similar_files
             ]
             
@@ -49,6 +106,14 @@ def find_similar_files():
             return jsonify({
                 'similar_files': normalized_similar_files
             })
+        except process_pool.PoolSaturated as e:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+            return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+        except concurrent.futures.TimeoutError:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+            return jsonify({'error': 'Feature extraction timed out'}), 504
         except Exception as e:
             # Clean up the uploaded file in case of error
             if os.path.exists(filepath):
@@ -61,7 +126,7 @@ def get_audio():
         if not request.json or 'filename' not in request.json:
             return jsonify({'error': 'No filename provided in request body'}), 400
             
-        file_path = request.json['filename']
+        file_path = from_client_path(request.json['filename'])
         
         # Check if file exists and is within allowed directory
         if not os.path.exists(file_path) or not os.path.abspath(file_path).startswith(os.path.abspath(cndpt_directory)):
@@ -71,5 +136,53 @@ def get_audio():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/categories', methods=['GET'])
+def get_categories():
+    try:
+        return jsonify({'categories': agent.get_categories()})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/visualization', methods=['POST'])
+def get_visualization():
+    try:
+        if not request.json or 'filename' not in request.json:
+            return jsonify({'error': 'No filename provided in request body'}), 400
+
+        file_path = from_client_path(request.json['filename'])
+        max_buckets = int(request.json.get('max_buckets', 2000))
+        n_bands = min(max(int(request.json.get('bands', visualization.SPECTRUM_BANDS)), 1), 512)
+        response_format = request.json.get('format', 'json')
+
+        # Check if file exists and is within allowed directory
+        if not os.path.exists(file_path) or not os.path.abspath(file_path).startswith(os.path.abspath(cndpt_directory)):
+            return jsonify({'error': 'File not found'}), 404
+
+        data = agent.get_visualization(file_path)
+
+        if response_format == 'binary':
+            # Float32 [min, max] peak pairs then band levels, section sizes in headers
+            layout, payload = visualization.visualization_to_bytes(data, max_buckets, n_bands)
+            response = send_file(io.BytesIO(payload), mimetype='application/octet-stream')
+            headers = {
+                'X-Sample-Rate': layout['sample_rate'],
+                'X-N-FFT': layout['n_fft'],
+                'X-Bucket-Size': layout['bucket_size'],
+                'X-Peak-Count': layout['peak_count'],
+                'X-Band-Count': layout['band_count'],
+            }
+            for name, value in headers.items():
+                response.headers[name] = str(value)
+            response.headers['Access-Control-Expose-Headers'] = ', '.join(headers)
+            return response
+
+        return jsonify(visualization.visualization_to_json(data, max_buckets, n_bands))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
+    # Keep the index live as recordings are added or removed,
+    # only in the reloader child that actually serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        agent.start_watching()
     app.run(debug=True) 
\ No newline at end of file
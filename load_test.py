@@ -0,0 +1,127 @@
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+SERVE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serve.py')
+
+
+def build_upload(file_path):
+    """
+    Multipart body and content type for posting `file_path` to /api/find-similar.
+    """
+    boundary = uuid.uuid4().hex
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    header = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="file"; filename="{os.path.basename(file_path)}"\r\n'
+        'Content-Type: audio/wav\r\n\r\n'
+    ).encode()
+    body = header + data + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def wait_for_port(host, port, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.5)
+    return False
+
+
+def run_load(url, body, content_type, concurrency, duration):
+    """
+    Post the same upload from `concurrency` threads for `duration` seconds.
+    Requests still running at the deadline are abandoned and counted as late,
+    so every other count finished within `duration`.
+
+    Returns:
+        tuple: (dict of successful, rejected (503), failed and late request counts, wall time in seconds)
+    """
+    counts = {'ok': 0, 'rejected': 0, 'failed': 0, 'late': 0}
+    lock = threading.Lock()
+    start = time.monotonic()
+    deadline = start + duration
+
+    def client():
+        while time.monotonic() < deadline:
+            request = urllib.request.Request(url, data=body, headers={'Content-Type': content_type})
+            try:
+                # Don't wait past the deadline for a response that can't be counted
+                timeout = max(deadline - time.monotonic(), 0.1)
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    response.read()
+                result = 'ok'
+            except urllib.error.HTTPError as e:
+                result = 'rejected' if e.code == 503 else 'failed'
+            except Exception:
+                result = 'failed'
+            if time.monotonic() > deadline:
+                result = 'late'
+            elif result == 'rejected':
+                time.sleep(0.05)
+            with lock:
+                counts[result] += 1
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts, time.monotonic() - start
+
+
+def main():
+    """
+    Start serve.py with each worker count in turn and measure the QPS of
+    /api/find-similar under a constant number of concurrent clients.
+    """
+    parser = argparse.ArgumentParser(description="Measure QPS scaling of serve.py with worker count")
+    parser.add_argument('query_file', help="WAV file uploaded by every request")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--startup-timeout', type=float, default=300)
+    args = parser.parse_args()
+
+    host = '127.0.0.1'
+    url = f'http://{host}:{args.port}/api/find-similar'
+    body, content_type = build_upload(args.query_file)
+
+    results = []
+    for workers in args.workers:
+        server = subprocess.Popen([
+            sys.executable, SERVE_SCRIPT,
+            '--host', host, '--port', str(args.port), '--workers', str(workers)
+        ])
+        try:
+            if not wait_for_port(host, args.port, args.startup_timeout):
+                print(f"Server with {workers} workers did not start")
+                continue
+            counts, elapsed = run_load(url, body, content_type, args.concurrency, args.duration)
+            results.append((workers, counts))
+            print(f"{workers} workers: {counts['ok'] / args.duration:.2f} QPS {counts} in {elapsed:.1f}s")
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+
+    print(f"{'workers':>8}{'QPS':>10}{'ok':>8}{'503':>8}{'failed':>8}{'late':>8}")
+    for workers, counts in results:
+        print(f"{workers:>8}{counts['ok'] / args.duration:>10.2f}"
+              f"{counts['ok']:>8}{counts['rejected']:>8}{counts['failed']:>8}{counts['late']:>8}")
+
+
+if __name__ == '__main__':
+    main()
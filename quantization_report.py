@@ -0,0 +1,25 @@
+import sys
+import worker as worker
+import utils.vector_index as vector_index
+
+
+def print_report(directory, k=5, n_queries=100, rescore=20):
+    """
+    Print memory savings and recall@k of each vector storage type
+    against the float64 baseline used by findCosinSimilarity.
+    """
+    agent = worker.Worker(directory)
+    report = vector_index.quantization_report(
+        agent.get_normalized_feature_files(), k=k, n_queries=n_queries, rescore=rescore
+    )
+    print(f"{'storage':<10}{'bytes':>12}{'savings':>10}{f'recall@{k}':>12}{'rescored':>12}")
+    for row in report:
+        print(
+            f"{row['storage']:<10}{row['bytes']:>12}{row['savings']:>10.1%}"
+            f"{row['recall_at_k']:>12.3f}{row['recall_at_k_rescored']:>12.3f}"
+        )
+
+
+if __name__ == "__main__":
+    cndpt_directory = sys.argv[1] if len(sys.argv) > 1 else "CNDPT-20250509T093006Z-1-001/CNDPT"
+    print_report(cndpt_directory)
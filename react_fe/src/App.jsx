@@ -12,6 +12,7 @@ function App() {
   const [similarSongs, setSimilarSongs] = useState([])
   const [audioUrls, setAudioUrls] = useState({})
   const [uploadedFileUrl, setUploadedFileUrl] = useState(null)
+  const [waveforms, setWaveforms] = useState({})
 
   const handleFileSelect = (event) => {
     const file = event.target.files[0]
@@ -35,6 +36,7 @@ function App() {
     setError(null)
     setSimilarSongs([])
     setAudioUrls({})
+    setWaveforms({})
 
     const formData = new FormData()
     formData.append('file', selectedFile)
@@ -47,7 +49,9 @@ function App() {
         },
       })
 
-      setSimilarSongs(response.data.similar_files || [])
+      const songs = response.data.similar_files || []
+      setSimilarSongs(songs)
+      songs.forEach(([songPath]) => fetchWaveform(songPath))
     } catch (err) {
       setError('Error finding similar songs. Please try again.')
       console.error('Error:', err)
@@ -56,6 +60,40 @@ function App() {
     }
   }
 
+  const fetchWaveform = async (songPath) => {
+    try {
+      // Precomputed peaks, no audio decoding needed
+      const response = await axios.post('http://localhost:5000/api/visualization', {
+        filename: songPath,
+        max_buckets: 300
+      })
+
+      setWaveforms(prev => ({
+        ...prev,
+        [songPath]: response.data
+      }))
+    } catch (err) {
+      console.error('Error:', err)
+    }
+  }
+
+  const renderWaveform = (waveform) => {
+    const width = waveform.peaks_max.length
+    const height = 60
+    const points = waveform.peaks_max.map((v, i) => `${i},${(1 - v) * height / 2}`)
+      .concat(waveform.peaks_min.map((v, i) => `${i},${(1 - v) * height / 2}`).reverse())
+      .join(' ')
+    return (
+      <svg
+        viewBox={`0 0 ${width} ${height}`}
+        preserveAspectRatio="none"
+        style={{ width: '100%', height: height, marginBottom: 8 }}
+      >
+        <polygon points={points} fill="#646cff" />
+      </svg>
+    )
+  }
+
   const handlePlayAudio = async (songPath) => {
     if (audioUrls[songPath]) return // Audio URL already fetched
 
@@ -233,6 +271,7 @@ function App() {
                 >
                   Similarity: {(similarity * 100).toFixed(2)}%
                 </Typography>
+                {waveforms[songPath] && renderWaveform(waveforms[songPath])}
                 <Button
                   variant="outlined"
                   onClick={() => handlePlayAudio(songPath)}
@@ -0,0 +1,163 @@
+import argparse
+import os
+import signal
+import socket
+import time
+import utils.process_pool as process_pool
+import utils.shared_index as shared_index
+
+
+def exit_worker(signum, frame):
+    raise SystemExit(0)
+
+
+def run_worker(app_module, sock, args, publisher):
+    """
+    Serve requests on the inherited listening socket until terminated.
+    """
+    from werkzeug.serving import make_server
+
+    # Unwind through the finally block below so the extraction pool is shut down
+    signal.signal(signal.SIGTERM, exit_worker)
+    # Map the published index, then follow its updates in the background
+    agent = app_module.agent
+    reader = shared_index.SharedIndexReader(publisher)
+    reader.refresh(agent)
+    # Files changed by the watcher may have new summaries
+    reader.start(agent, on_refresh=agent.visualization_cache.clear)
+    app_module.extraction_pool = process_pool.ExtractionPool(args.extract_workers, args.max_pending)
+    server = make_server(args.host, args.port, app_module.app, threaded=True, fd=sock.fileno())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        app_module.extraction_pool.shutdown()
+
+
+def run_watcher(agent, publisher):
+    """
+    Keep the index live as WAV files are added, modified or removed, and publish
+    every new version to the server processes. A single watcher runs per server,
+    so each change is extracted once and the feature files have one writer.
+
+    Each start loads the index from the feature files on disk and publishes it,
+    so a restarted watcher never publishes vectors older than those files.
+    """
+    signal.signal(signal.SIGTERM, exit_worker)
+    agent.on_index_update = lambda: publisher.publish(agent.index)
+    try:
+        agent.load_index()
+        publisher.publish(agent.index)
+        agent.watch()
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    """
+    Production serving mode: load the corpus index once into shared memory,
+    then fork worker processes that all accept on the same socket, and a
+    watcher process that publishes index updates to them.
+    Unix only, as it relies on os.fork.
+    """
+    parser = argparse.ArgumentParser(description="Pre-fork server for the audio similarity API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Number of server processes")
+    parser.add_argument('--extract-workers', type=int, default=1,
+                        help="Feature extraction processes per server process")
+    parser.add_argument('--max-pending', type=int, default=4,
+                        help="Uploads a server process accepts before answering 503")
+    parser.add_argument('--no-watch', action='store_true',
+                        help="Serve a fixed index, without watching the dataset directory")
+    args = parser.parse_args()
+
+    import app as app_module
+
+    agent = app_module.agent
+    publisher = shared_index.SharedIndexPublisher()
+
+    # Child pid -> (function run by the child, start time)
+    children = {}
+    stopping = False
+
+    def spawn(run):
+        pid = os.fork()
+        if pid == 0:
+            # Never fall back into the parent's loop, whatever happens in the child
+            try:
+                run()
+            finally:
+                os._exit(0)
+        children[pid] = (run, time.monotonic())
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    sock = None
+    try:
+        if args.no_watch:
+            agent.load_index()
+            publisher.publish(agent.index)
+        else:
+            # The watcher loads the index and publishes the first version
+            spawn(lambda: run_watcher(agent, publisher))
+            while publisher.generation.value == 0 and not stopping:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+                if pid:
+                    children.pop(pid, None)
+                    raise SystemExit(f"Watcher exited with status {status} before publishing the index")
+                time.sleep(0.2)
+            if stopping:
+                return
+        # Workers map the published version, the parent needs no copy
+        agent.index = None
+
+        # Bind after the index is published, so an accepted connection means the server is ready
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((args.host, args.port))
+        sock.listen(128)
+
+        for _ in range(args.workers):
+            spawn(lambda: run_worker(app_module, sock, args, publisher))
+        print(f"Serving on http://{args.host}:{args.port} with {args.workers} workers")
+
+        while children:
+            pid, status = os.wait()
+            child = children.pop(pid, None)
+            if stopping or child is None:
+                continue
+            # Replace children that crashed or were killed, throttled if they die right away
+            run, started = child
+            print(f"Process {pid} exited with status {status}, restarting")
+            if time.monotonic() - started < 1:
+                time.sleep(1)
+            if not stopping:
+                spawn(run)
+    finally:
+        if sock is not None:
+            sock.close()
+        # Children still running when the parent fails must not outlive it
+        stop(None, None)
+        for pid in list(children):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        publisher.release()
+
+
+if __name__ == '__main__':
+    main()
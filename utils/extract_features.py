@@ -32,9 +32,10 @@ def extract_spectral_centroid(
     data,
     sr = 16000,
     n_fft = 2048,
-    hop_length = 160
+    hop_length = 160,
+    S = None
     ):
-  spectral_centroid = librosa.feature.spectral_centroid(y=data, sr=sr, n_fft=n_fft, hop_length=hop_length)
+  spectral_centroid = librosa.feature.spectral_centroid(y=data, sr=sr, S=S, n_fft=n_fft, hop_length=hop_length)
   return spectral_centroid
 
 def extract_spectral_flatness(
@@ -66,11 +67,19 @@ def extractFeature(
   spectral_contrast = extract_spectral_contrast(y, sr, spectral_contrast_bands)
   features['spectral_contrast'] = spectral_contrast
   
-  spectral_centroid = extract_spectral_centroid(y, sr, n_fft, hop_length)
+  # Magnitude spectrogram is shared with the visualization summaries
+  magnitude_spectrum = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length))
+  features['magnitude_spectrum'] = magnitude_spectrum
+
+  spectral_centroid = extract_spectral_centroid(y, sr, n_fft, hop_length, S=magnitude_spectrum)
   features['spectral_centroid'] = spectral_centroid
   
   spectral_flatness = extract_spectral_flatness(y)
   features['spectral_flatness'] = spectral_flatness
+
+  features['signal'] = y
+  features['sr'] = sr
+  features['n_fft'] = n_fft
   
   return features
 
@@ -0,0 +1,125 @@
+import os
+import re
+import json
+import numpy as np
+import soundfile as sf
+
+# Clip number at the end of file names like "How to speak-03.wav"
+CLIP_NUMBER_PATTERN = re.compile(r'-(\d+)$')
+
+# Accepted search filters, see VectorIndex.search
+FILTER_KEYS = ('category', 'clip', 'min_duration', 'max_duration', 'sample_rate')
+
+METADATA_DIR = 'metadata'
+
+
+def build_file_metadata(directory_path, wav_path, duration, sample_rate):
+    """
+    Metadata of a dataset WAV file: its path relative to the dataset, its topic
+    directory, the clip number parsed from the file name, duration and sample rate.
+    Unknown values are '' for the category, -1 for integers and NaN for the duration.
+
+    Returns:
+        dict: Keys 'wav_path', 'category', 'clip', 'duration', 'sample_rate'
+    """
+    rel_path = os.path.relpath(wav_path, directory_path).replace('\\', '/')
+    match = CLIP_NUMBER_PATTERN.search(os.path.splitext(os.path.basename(rel_path))[0])
+    return {
+        'wav_path': rel_path,
+        'category': os.path.dirname(rel_path),
+        'clip': int(match.group(1)) if match else -1,
+        'duration': float(duration),
+        'sample_rate': int(sample_rate),
+    }
+
+
+def get_file_metadata(directory_path, wav_path):
+    """
+    Metadata of a WAV file with duration and sample rate read from its header,
+    for files ingested before metadata was saved at ingestion.
+    """
+    try:
+        info = sf.info(wav_path)
+        duration = info.duration
+        sample_rate = info.samplerate
+    except Exception:
+        duration = float('nan')
+        sample_rate = -1
+    return build_file_metadata(directory_path, wav_path, duration, sample_rate)
+
+
+def get_metadata_path(directory_path, rel_stem):
+    """
+    Path of the saved metadata for the dataset file with relative path `rel_stem`
+    (without extension), mirroring the dataset layout inside the metadata directory.
+    """
+    return os.path.join(directory_path, METADATA_DIR, rel_stem + '.json')
+
+
+def save_metadata(file_path, file_metadata):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'w') as f:
+        json.dump(file_metadata, f, indent=4)
+
+
+def load_metadata(file_path):
+    """
+    Saved metadata dict, or None when there is none.
+    """
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, 'r') as f:
+        return json.load(f)
+
+
+def find_wav_file(directory_path, rel_stem):
+    """
+    Actual path of the WAV file with relative path `rel_stem`, whatever the
+    case of its extension, or None when there is none.
+    """
+    folder = os.path.join(directory_path, os.path.dirname(rel_stem))
+    stem = os.path.basename(rel_stem)
+    try:
+        files = sorted(os.listdir(folder))
+    except OSError:
+        return None
+    for file in files:
+        name, extension = os.path.splitext(file)
+        if name == stem and extension.lower() == '.wav':
+            return os.path.join(folder, file)
+    return None
+
+
+def build_columns(metadata, n_rows):
+    """
+    Turn a list of per-row metadata dicts into column arrays.
+    Rows without metadata get unknown values.
+
+    Returns:
+        dict: Column name -> np.ndarray with one value per row
+    """
+    if metadata is None:
+        metadata = [{}] * n_rows
+    return {
+        'category': np.array([m.get('category', '') for m in metadata], dtype=object).reshape(n_rows),
+        'clip': np.array([m.get('clip', -1) for m in metadata], dtype=np.int32).reshape(n_rows),
+        'duration': np.array([m.get('duration', np.nan) for m in metadata], dtype=np.float32).reshape(n_rows),
+        'sample_rate': np.array([m.get('sample_rate', -1) for m in metadata], dtype=np.int32).reshape(n_rows),
+    }
+
+
+def validate_filters(filters):
+    """
+    Check filter keys and wrap single category, clip and sample rate values in lists.
+
+    Returns:
+        dict: Filters with list values for the exact match keys
+    """
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown filters {sorted(unknown)}, expected some of {FILTER_KEYS}")
+    validated = dict(filters)
+    for key in ('category', 'clip', 'sample_rate'):
+        if key in validated and not isinstance(validated[key], (list, tuple, set)):
+            validated[key] = [validated[key]]
+    return validated
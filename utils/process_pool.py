@@ -0,0 +1,66 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+class PoolSaturated(Exception):
+    """Raised when the extraction pool already holds its maximum of pending jobs."""
+
+
+class ExtractionPool:
+    """
+    Bounded process pool for CPU-heavy feature extraction.
+    At most `max_pending` jobs (running or queued) are accepted; further
+    submissions fail immediately with PoolSaturated instead of queueing.
+    When an extraction process dies (e.g. killed for memory) the executor
+    is replaced, so only the jobs it was running fail.
+    """
+
+    def __init__(self, max_workers=1, max_pending=4):
+        self.max_workers = max_workers
+        self.executor = self._create_executor()
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+
+    def _create_executor(self):
+        # Spawn keeps the extraction processes independent of the server threads
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+
+    def _replace_broken(self, executor):
+        """
+        Swap in a new executor unless `executor` was already replaced.
+        """
+        with self.lock:
+            if self.executor is not executor:
+                return
+            self.executor = self._create_executor()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _job_done(self, executor, future):
+        self.slots.release()
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self._replace_broken(executor)
+
+    def submit(self, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            raise PoolSaturated("Extraction queue is full")
+        try:
+            executor = self.executor
+            try:
+                future = executor.submit(fn, *args)
+            except BrokenProcessPool:
+                self._replace_broken(executor)
+                executor = self.executor
+                future = executor.submit(fn, *args)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda f: self._job_done(executor, f))
+        return future
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
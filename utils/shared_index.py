@@ -0,0 +1,299 @@
+import multiprocessing
+import pickle
+import threading
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+import utils.vector_index as vector_index
+
+# VectorIndex arrays copied into shared memory, row_ranges only exists for int8 storage
+SHARED_ARRAYS = ('vectors', 'row_norms', 'row_ranges')
+
+
+def share_array(array):
+    """
+    Copy `array` into a new shared memory block.
+
+    Returns:
+        SharedMemory: The block holding the array data
+    """
+    # Zero-sized blocks are not allowed
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+    return block
+
+
+def load_manifest(manifest_name):
+    """
+    Unpickle the content of a manifest block.
+    """
+    manifest_block = shared_memory.SharedMemory(name=manifest_name)
+    try:
+        # Trailing bytes of the block after the pickle are ignored
+        return pickle.loads(manifest_block.buf)
+    finally:
+        manifest_block.close()
+
+
+def create_manifest(manifest):
+    """
+    Pickle `manifest` into a new shared memory block.
+
+    Returns:
+        str: Name of the block
+    """
+    data = pickle.dumps(manifest, protocol=pickle.HIGHEST_PROTOCOL)
+    manifest_block = shared_memory.SharedMemory(create=True, size=len(data))
+    manifest_block.buf[:len(data)] = data
+    manifest_block.close()
+    return manifest_block.name
+
+
+def unlink_block(name):
+    try:
+        block = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+
+def publish_base(index):
+    """
+    Copy the main arrays of `index` into shared memory, described by a manifest
+    block holding the paths, metadata, filter lookups and array layout.
+    The delta and hidden rows are published separately, see SharedIndexPublisher.
+
+    Returns:
+        str: Name of the manifest block
+    """
+    arrays = {}
+    for name in SHARED_ARRAYS:
+        array = getattr(index, name)
+        if array is not None:
+            block = share_array(array)
+            arrays[name] = (block.name, array.shape, array.dtype.str)
+            block.close()
+    return create_manifest({
+        'storage': index.storage,
+        'paths': index.paths,
+        'metadata': index.metadata,
+        'partitions': index.partitions,
+        'row_lookup': index.row_lookup,
+        'arrays': arrays,
+    })
+
+
+def attach_base(manifest_name):
+    """
+    Map a published base into this process without copying it.
+
+    Returns:
+        tuple: (VectorIndex backed by shared memory, list of SharedMemory blocks)
+    """
+    manifest = load_manifest(manifest_name)
+    index = vector_index.VectorIndex(manifest['storage'])
+    index.paths = manifest['paths']
+    index.metadata = manifest['metadata']
+    index.partitions = manifest['partitions']
+    index.row_lookup = manifest['row_lookup']
+    blocks = []
+    try:
+        for name, (block_name, shape, dtype) in manifest['arrays'].items():
+            block = shared_memory.SharedMemory(name=block_name)
+            blocks.append(block)
+            # frombuffer holds on to the buffer, so closing the block fails while a search uses it
+            view = np.frombuffer(block.buf, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+            # The index is read only once shared
+            view.flags.writeable = False
+            setattr(index, name, view)
+    except FileNotFoundError:
+        close_blocks(blocks)
+        raise
+    return index, blocks
+
+
+def unlink_base(manifest_name):
+    """
+    Remove the shared memory blocks of a published base. Processes that
+    still map them keep their pages until they close them.
+    """
+    try:
+        manifest = load_manifest(manifest_name)
+    except FileNotFoundError:
+        return
+    for block_name, _, _ in manifest['arrays'].values():
+        unlink_block(block_name)
+    unlink_block(manifest_name)
+
+
+def close_blocks(blocks):
+    """
+    Unmap the blocks that no array references anymore.
+
+    Returns:
+        list: Blocks still in use, to close later
+    """
+    in_use = []
+    for block in blocks:
+        try:
+            block.close()
+        except BufferError:
+            in_use.append(block)
+    return in_use
+
+
+class SharedIndexPublisher:
+    """
+    Publishes successive versions of a VectorIndex to forked processes.
+
+    A version is a small manifest block naming the base it builds on (the
+    main arrays, see publish_base) and holding the pickled hidden rows and
+    delta index. The base is only copied again after the index merged its
+    delta, so a small change publishes a small manifest. The version name
+    and a generation counter live in shared values created before forking,
+    so readers notice a new version with one integer read.
+    """
+
+    def __init__(self):
+        # Start the tracker of shared memory blocks before forking, so every process uses the
+        # same one and a killed watcher doesn't take the published blocks down with its tracker
+        resource_tracker.ensure_running()
+        self.generation = multiprocessing.Value('q', 0)
+        self.manifest_name = multiprocessing.Array('c', 64)
+        # Main vectors and base name last published by this process
+        self.base_vectors = None
+        self.base_name = None
+
+    def current(self):
+        """
+        (generation, version manifest name) of the latest published version.
+        """
+        with self.generation.get_lock():
+            return self.generation.value, self.manifest_name.value.decode()
+
+    def publish(self, index):
+        """
+        Make the current content of `index` the published version and remove
+        the previous one, and its base when it changed.
+        """
+        _, vectors, _, _, _, _, _, removed_rows, delta = index._snapshot()
+        # Arrays are replaced, never changed in place, so the same object means the same base
+        if self.base_name is None or vectors is not self.base_vectors:
+            self.base_name = publish_base(index)
+            self.base_vectors = vectors
+        manifest_name = create_manifest({
+            'base': self.base_name,
+            'removed_rows': removed_rows,
+            'delta': delta,
+        })
+
+        with self.generation.get_lock():
+            previous = self.manifest_name.value.decode()
+            self.manifest_name.value = manifest_name.encode()
+            self.generation.value += 1
+        if previous:
+            self.unlink_version(previous, keep_base=self.base_name)
+
+    @staticmethod
+    def unlink_version(manifest_name, keep_base=None):
+        try:
+            base_name = load_manifest(manifest_name)['base']
+        except FileNotFoundError:
+            return
+        if base_name != keep_base:
+            unlink_base(base_name)
+        unlink_block(manifest_name)
+
+    def release(self):
+        """
+        Remove the current version, once no process publishes or reads anymore.
+        """
+        with self.generation.get_lock():
+            current = self.manifest_name.value.decode()
+            self.manifest_name.value = b''
+        if current:
+            self.unlink_version(current)
+
+
+class SharedIndexReader:
+    """
+    Keeps the index of a Worker on the latest version of a SharedIndexPublisher.
+    A new base is only mapped when the publisher copied one, otherwise only the
+    small version manifest is read. Blocks of replaced bases are closed once no
+    search uses them anymore.
+    """
+
+    def __init__(self, publisher):
+        self.publisher = publisher
+        self.generation = 0
+        self.base_name = None
+        self.base = None
+        self.blocks = []
+        self.retired = []
+        self.lock = threading.Lock()
+        self.stop_event = None
+        self.thread = None
+
+    def refresh(self, agent):
+        """
+        Swap in the latest published index if it changed since the last call.
+
+        Returns:
+            bool: Whether a new version was swapped in
+        """
+        if self.publisher.generation.value == self.generation:
+            return False
+        with self.lock:
+            generation, manifest_name = self.publisher.current()
+            if generation == self.generation or not manifest_name:
+                return False
+            try:
+                version = load_manifest(manifest_name)
+                if version['base'] != self.base_name:
+                    base, blocks = attach_base(version['base'])
+                else:
+                    base, blocks = self.base, self.blocks
+            except FileNotFoundError:
+                # Replaced again while attaching, the next call picks up the newer one
+                return False
+            index = base.copy()
+            index.removed_rows = version['removed_rows']
+            index.delta = version['delta']
+            agent.index = index
+            if blocks is not self.blocks:
+                retired = self.retired + self.blocks
+                self.base_name = version['base']
+                self.base = base
+                self.blocks = blocks
+                self.retired = close_blocks(retired)
+            self.generation = generation
+            return True
+
+    def start(self, agent, interval=0.5, on_refresh=None):
+        """
+        Refresh every `interval` seconds in a background thread, so requests
+        never wait for a new version to be mapped.
+
+        Args:
+            agent (Worker): Worker whose index is kept up to date
+            interval (float): Seconds between checks
+            on_refresh (callable): Called after a new version was swapped in
+        """
+        self.stop_event = threading.Event()
+
+        def run():
+            while not self.stop_event.wait(interval):
+                try:
+                    if self.refresh(agent) and on_refresh is not None:
+                        on_refresh()
+                except Exception as e:
+                    print(f"Error refreshing the shared index: {str(e)}")
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
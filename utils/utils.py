@@ -53,16 +53,9 @@ def getFeatureFromJSON(file_path):
     
     return np.array(feature_vector)
 
-def findCosinSimilarity(test_feature_vector, sample_feature_vector):
+def getFeatureWeightVector():
     """
-    Calculate weighted cosine similarity between two feature vectors.
-    
-    Args:
-        test_feature_vector: Feature vector of the test audio
-        sample_feature_vector: Feature vector of the sample audio
-        
-    Returns:
-        float: Weighted cosine similarity score between 0 and 1
+    Per-dimension weights for feature vectors laid out as in getFeatureFromJSON.
     """
     # Define feature weights and their corresponding lengths
     feature_weights = {
@@ -92,7 +85,20 @@ def findCosinSimilarity(test_feature_vector, sample_feature_vector):
         weight = feature_weights[feature]
         weight_vector.extend([weight] * length)
     
-    weight_vector = np.array(weight_vector)
+    return np.array(weight_vector)
+
+def findCosinSimilarity(test_feature_vector, sample_feature_vector):
+    """
+    Calculate weighted cosine similarity between two feature vectors.
+    
+    Args:
+        test_feature_vector: Feature vector of the test audio
+        sample_feature_vector: Feature vector of the sample audio
+        
+    Returns:
+        float: Weighted cosine similarity score between 0 and 1
+    """
+    weight_vector = getFeatureWeightVector()
     
     # Reshape vectors to 2D arrays for cosine_similarity
     test_vector = test_feature_vector.reshape(1, -1)
@@ -0,0 +1,509 @@
+import threading
+import numpy as np
+from tqdm import tqdm
+import utils.utils as utils
+import utils.metadata as metadata
+
+# Storage dtypes for the corpus vectors, float64 matches findCosinSimilarity exactly
+STORAGE_TYPES = ('float64', 'float32', 'float16', 'int8')
+
+# Normalized features lie in [0, 1], int8 code c maps back to (c + 128) / 255.
+# Rows outside that range use their own [low, high] with the same 256 levels.
+INT8_SCALE = 255.0
+INT8_OFFSET = 128
+
+# Rows converted to float at a time while scoring compact storage
+SCORE_BLOCK_ROWS = 65536
+
+# Rows the delta segment holds before update merges it into the main arrays
+DELTA_MAX_ROWS = 4096
+
+
+def quantize_int8(vectors):
+    """
+    Scalar quantize normalized feature vectors to int8 using the known [0, 1] range.
+    Rows with values outside it, e.g. new files normalized with the saved coefficients,
+    are quantized over their own range instead of being clipped.
+
+    Returns:
+        tuple: (int8 codes, float32 array of [low, step] per row)
+    """
+    vectors = np.asarray(vectors, dtype=np.float64)
+    row_ranges = np.empty((len(vectors), 2), dtype=np.float32)
+    low = np.minimum(vectors.min(axis=1, initial=0.0), 0.0)
+    high = np.maximum(vectors.max(axis=1, initial=1.0), 1.0)
+    row_ranges[:, 0] = low
+    row_ranges[:, 1] = (high - low) / INT8_SCALE
+    codes = np.rint((vectors - row_ranges[:, :1]) / row_ranges[:, 1:]) - INT8_OFFSET
+    return np.clip(codes, -INT8_OFFSET, INT8_SCALE - INT8_OFFSET).astype(np.int8), row_ranges
+
+
+def dequantize_int8(codes, row_ranges):
+    return (codes.astype(np.float32) + INT8_OFFSET) * row_ranges[:, 1:] + row_ranges[:, :1]
+
+
+class VectorIndex:
+    """
+    In-memory matrix of normalized corpus feature vectors scored with the same
+    weighted cosine similarity as utils.findCosinSimilarity.
+
+    Cosine similarity of the weighted vectors does not depend on the unweighted
+    norms, so each query is a single matrix-vector product divided by the
+    precomputed norms of the weighted rows.
+
+    Updates build new arrays and swap them in under a lock, so searches
+    running concurrently always see a consistent set of rows. New and modified
+    rows go to a small delta index and the main rows they replace are hidden,
+    so an update costs time in proportion to the change, not the corpus; the
+    delta is merged into the main arrays once it grows past `delta_max_rows`.
+
+    Each row carries metadata columns (see utils.metadata). Rows are kept
+    ordered by category, so a category filter scores a contiguous slice of
+    the matrix. Clip and sample rate values map to precomputed row id arrays
+    and durations to a sorted order, so other filters resolve without scanning
+    the columns and only the matching rows are gathered and scored.
+    """
+
+    def __init__(self, storage='float32'):
+        if storage not in STORAGE_TYPES:
+            raise ValueError(f"Unknown storage type {storage}, expected one of {STORAGE_TYPES}")
+        self.storage = storage
+        self.compute_dtype = np.float64 if storage == 'float64' else np.float32
+        self.sqrt_weights = np.sqrt(utils.getFeatureWeightVector()).astype(self.compute_dtype)
+        self.paths = []
+        self.vectors = None
+        self.row_norms = None
+        # int8 storage only, [low, step] of each row, see quantize_int8
+        self.row_ranges = None
+        self.metadata = metadata.build_columns(None, 0)
+        # Category -> slice of its contiguous rows
+        self.partitions = {}
+        # Filter lookups, see build_row_lookup
+        self.row_lookup = build_row_lookup(self.metadata)
+        # Sorted main rows replaced or removed since the last merge
+        self.removed_rows = np.zeros(0, dtype=np.int64)
+        # VectorIndex of the rows added or replaced since the last merge
+        self.delta = None
+        self.delta_max_rows = DELTA_MAX_ROWS
+        # Path -> main row, built by the first update after a merge
+        self.row_ids = None
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # Pickled to publish the delta to other processes, locks can't be pickled
+        state = self.__dict__.copy()
+        del state['lock']
+        state['row_ids'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        paths, _, _, _, _, _, _, removed_rows, delta = self._snapshot()
+        return len(paths) - len(removed_rows) + (len(delta) if delta is not None else 0)
+
+    @property
+    def nbytes(self):
+        _, vectors, row_norms, _, _, _, row_ranges, removed_rows, delta = self._snapshot()
+        if vectors is None:
+            return 0
+        row_ranges = 0 if row_ranges is None else row_ranges.nbytes
+        delta = 0 if delta is None else delta.nbytes
+        return vectors.nbytes + row_norms.nbytes + row_ranges + removed_rows.nbytes + delta
+
+    def build(self, json_files, file_metadata=None, row_paths=None):
+        """
+        Load normalized feature JSON files into the index.
+
+        Args:
+            json_files (list): Paths of normalized feature JSON files
+            file_metadata (list): Optional metadata dict per file, from metadata.get_file_metadata
+            row_paths (list): Optional path returned by search for each file, defaults to the JSON path
+        """
+        paths = []
+        vectors = []
+        rows_metadata = []
+        for i, file_path in enumerate(tqdm(json_files, desc="Loading index", unit="file")):
+            try:
+                vectors.append(utils.getFeatureFromJSON(file_path))
+                paths.append(row_paths[i] if row_paths is not None else file_path)
+                rows_metadata.append(file_metadata[i] if file_metadata is not None else {})
+            except Exception as e:
+                tqdm.write(f"Error loading {file_path}: {str(e)}")
+        matrix = np.array(vectors, dtype=np.float64).reshape(len(vectors), len(self.sqrt_weights))
+        self.set_vectors(paths, matrix, rows_metadata)
+
+    def set_vectors(self, paths, matrix, file_metadata=None):
+        """
+        Replace the index content with `matrix` (one float row per entry of `paths`).
+        """
+        vectors, row_norms, row_ranges = self._encode(matrix)
+        self._swap(list(paths), vectors, row_norms, metadata.build_columns(file_metadata, len(paths)), row_ranges)
+
+    def update(self, paths, matrix, removed_paths=(), file_metadata=None):
+        """
+        Insert or replace the rows of `paths` and drop `removed_paths`.
+        The new rows go to the delta index and the main rows they replace are
+        hidden; the delta is merged into the main arrays once it grows past
+        `delta_max_rows`. Updates must come from one thread at a time.
+
+        Args:
+            paths (list): Row paths of the new or modified entries
+            matrix (np.ndarray): One float row per entry of `paths`
+            removed_paths (list): Row paths to remove
+            file_metadata (list): Optional metadata dict per entry of `paths`
+        """
+        main_paths, vectors, _, _, _, _, _, removed_rows, delta = self._snapshot()
+        if vectors is None:
+            self.set_vectors(paths, matrix, file_metadata)
+            return
+        if self.row_ids is None:
+            self.row_ids = {path: row for row, path in enumerate(main_paths)}
+        replaced = set(paths) | set(removed_paths)
+        hidden = np.array([self.row_ids[path] for path in replaced if path in self.row_ids], dtype=np.int64)
+
+        # Build a new delta rather than changing the one concurrent searches may be using
+        new_delta = delta.copy() if delta is not None else VectorIndex(self.storage)
+        new_delta.replace_rows(paths, matrix, removed_paths, file_metadata)
+        with self.lock:
+            self.removed_rows = np.union1d(removed_rows, hidden)
+            self.delta = new_delta
+        if len(new_delta) > self.delta_max_rows:
+            self.merge()
+
+    def replace_rows(self, paths, matrix, removed_paths=(), file_metadata=None):
+        """
+        Insert or replace the rows of `paths` and drop `removed_paths` in the
+        main arrays, reallocating them once for the whole batch. Used for the
+        delta index, whose own delta stays empty.
+        """
+        snapshot = self._snapshot()
+        current_paths, current_vectors, current_norms, current_columns = snapshot[:4]
+        current_ranges = snapshot[6]
+        if current_vectors is None:
+            self.set_vectors(paths, matrix, file_metadata)
+            return
+        replaced = set(paths) | set(removed_paths)
+        keep = np.array([path not in replaced for path in current_paths], dtype=bool).reshape(len(current_paths))
+        vectors, row_norms, row_ranges = self._encode(matrix)
+        columns = metadata.build_columns(file_metadata, len(paths))
+        self._swap(
+            [path for path, kept in zip(current_paths, keep) if kept] + list(paths),
+            np.concatenate([current_vectors[keep], vectors]),
+            np.concatenate([current_norms[keep], row_norms]),
+            {name: np.concatenate([current_columns[name][keep], columns[name]]) for name in columns},
+            None if row_ranges is None else np.concatenate([current_ranges[keep], row_ranges])
+        )
+
+    def merge(self):
+        """
+        Fold the delta into the main arrays and drop the hidden rows, reordering
+        the arrays and rebuilding the filter lookups once.
+        """
+        paths, vectors, row_norms, columns, _, _, row_ranges, removed_rows, delta = self._snapshot()
+        keep = np.ones(len(paths), dtype=bool)
+        keep[removed_rows] = False
+        parts = [([path for path, kept in zip(paths, keep) if kept], vectors[keep], row_norms[keep],
+                  {name: values[keep] for name, values in columns.items()},
+                  None if row_ranges is None else row_ranges[keep])]
+        if delta is not None and delta.vectors is not None:
+            parts.append(delta._snapshot()[:4] + (delta.row_ranges,))
+        self._swap(
+            [path for part in parts for path in part[0]],
+            np.concatenate([part[1] for part in parts]),
+            np.concatenate([part[2] for part in parts]),
+            {name: np.concatenate([part[3][name] for part in parts]) for name in columns},
+            None if row_ranges is None else np.concatenate([part[4] for part in parts])
+        )
+
+    def copy(self):
+        """
+        New index sharing this one's arrays, which are never changed in place.
+        """
+        copy = VectorIndex(self.storage)
+        (copy.paths, copy.vectors, copy.row_norms, copy.metadata, copy.partitions,
+         copy.row_lookup, copy.row_ranges, copy.removed_rows, copy.delta) = self._snapshot()
+        return copy
+
+    def indexed_paths(self):
+        """
+        Paths of all indexed rows, the visible main rows followed by the delta.
+        """
+        paths, _, _, _, _, _, _, removed_rows, delta = self._snapshot()
+        removed = set(removed_rows.tolist())
+        visible = [path for row, path in enumerate(paths) if row not in removed]
+        return visible + (delta.indexed_paths() if delta is not None else [])
+
+    def _encode(self, matrix):
+        row_ranges = None
+        if self.storage == 'int8':
+            vectors, row_ranges = quantize_int8(matrix)
+            stored = dequantize_int8(vectors, row_ranges)
+            out_of_range = int(np.count_nonzero(((matrix < 0) | (matrix > 1)).any(axis=1)))
+            if out_of_range:
+                tqdm.write(f"Warning: {out_of_range} vectors fall outside the normalized [0, 1] range, "
+                           "re-run normalize_features to refresh the coefficients")
+        else:
+            vectors = matrix.astype(self.storage)
+            stored = vectors.astype(self.compute_dtype)
+        return vectors, self._row_norms(stored), row_ranges
+
+    def _swap(self, paths, vectors, row_norms, columns, row_ranges=None):
+        # Keep each category contiguous so a category filter is a slice of the matrix
+        order = np.argsort(columns['category'].astype(str), kind='stable')
+        paths = [paths[row] for row in order]
+        vectors = vectors[order]
+        row_norms = row_norms[order]
+        if row_ranges is not None:
+            row_ranges = row_ranges[order]
+        columns = {name: values[order] for name, values in columns.items()}
+
+        partitions = {}
+        categories = columns['category']
+        if len(categories):
+            boundaries = np.flatnonzero(categories[1:] != categories[:-1]) + 1
+            starts = np.concatenate([[0], boundaries])
+            stops = np.concatenate([boundaries, [len(categories)]])
+            for start, stop in zip(starts, stops):
+                partitions[categories[start]] = slice(int(start), int(stop))
+        row_lookup = build_row_lookup(columns)
+
+        with self.lock:
+            self.paths = paths
+            self.vectors = vectors
+            self.row_norms = row_norms
+            self.row_ranges = row_ranges
+            self.metadata = columns
+            self.partitions = partitions
+            self.row_lookup = row_lookup
+            self.removed_rows = np.zeros(0, dtype=np.int64)
+            self.delta = None
+        self.row_ids = None
+
+    def _snapshot(self):
+        with self.lock:
+            return (self.paths, self.vectors, self.row_norms, self.metadata, self.partitions,
+                    self.row_lookup, self.row_ranges, self.removed_rows, self.delta)
+
+    def categories(self):
+        """
+        Number of indexed files per category.
+        """
+        _, _, _, columns, partitions, _, _, removed_rows, delta = self._snapshot()
+        counts = {category: rows.stop - rows.start for category, rows in partitions.items()}
+        for category in columns['category'][removed_rows]:
+            counts[category] -= 1
+        if delta is not None:
+            for category, count in delta.categories().items():
+                counts[category] = counts.get(category, 0) + count
+        return {category: count for category, count in counts.items() if count > 0}
+
+    def _resolve_rows(self, filters, partitions, row_lookup, n_rows):
+        """
+        Rows matching `filters`, as a slice when they are contiguous
+        (no filter or a single category) and as a sorted array of row ids otherwise.
+        """
+        filters = metadata.validate_filters(filters)
+        if 'category' in filters:
+            ranges = [partitions[category] for category in filters['category'] if category in partitions]
+            if len(ranges) == 1:
+                rows = ranges[0]
+            else:
+                rows = np.sort(np.concatenate([np.arange(r.start, r.stop) for r in ranges] + [np.zeros(0, dtype=np.int64)]))
+        else:
+            rows = slice(0, n_rows)
+
+        for key, cast in (('clip', int), ('sample_rate', int)):
+            if key in filters:
+                groups = row_lookup[key]
+                ids = [groups[cast(value)] for value in filters[key] if cast(value) in groups]
+                rows = intersect_rows(rows, np.unique(np.concatenate(ids + [np.zeros(0, dtype=np.int64)])))
+
+        if 'min_duration' in filters or 'max_duration' in filters:
+            # Unknown (NaN) durations are not in the order, so never match a bound
+            durations, order = row_lookup['duration']
+            start = np.searchsorted(durations, float(filters['min_duration']), 'left') if 'min_duration' in filters else 0
+            stop = np.searchsorted(durations, float(filters['max_duration']), 'right') if 'max_duration' in filters else len(order)
+            rows = intersect_rows(rows, np.sort(order[start:max(start, stop)]))
+        return rows
+
+    def _row_norms(self, stored):
+        norms = np.linalg.norm(stored * self.sqrt_weights, axis=1).astype(self.compute_dtype)
+        # Zero rows score 0 instead of dividing by zero
+        norms[norms == 0] = 1
+        return norms
+
+    def score(self, query_vector):
+        """
+        Weighted cosine similarity of `query_vector` against every main row,
+        including hidden ones and excluding the delta.
+
+        Returns:
+            np.ndarray: One similarity per main row, in row order
+        """
+        snapshot = self._snapshot()
+        return self._score(query_vector, snapshot[1], snapshot[2], snapshot[6])
+
+    def _score(self, query_vector, vectors, row_norms, row_ranges=None):
+        n_rows = 0 if vectors is None else len(vectors)
+        query = np.asarray(query_vector, dtype=self.compute_dtype) * self.sqrt_weights
+        query_norm = np.linalg.norm(query)
+        if n_rows == 0 or query_norm == 0:
+            return np.zeros(n_rows, dtype=self.compute_dtype)
+        weighted_query = query * self.sqrt_weights / query_norm
+
+        if self.storage in ('float64', 'float32'):
+            dots = vectors @ weighted_query
+        else:
+            dots = np.empty(n_rows, dtype=self.compute_dtype)
+            for start in range(0, n_rows, SCORE_BLOCK_ROWS):
+                block = vectors[start:start + SCORE_BLOCK_ROWS].astype(self.compute_dtype)
+                dots[start:start + len(block)] = block @ weighted_query
+            if self.storage == 'int8':
+                # Undo each row's code offset and scale without dequantizing the matrix
+                steps = row_ranges[:, 1]
+                dots = steps * dots + (row_ranges[:, 0] + INT8_OFFSET * steps) * weighted_query.sum()
+        return dots / row_norms
+
+    def search(self, query_vector, top_n=5, filters=None):
+        """
+        Find the top N entries most similar to `query_vector`.
+
+        Args:
+            query_vector (np.ndarray): Normalized feature vector
+            top_n (int): Number of entries to return
+            filters (dict): Optional metadata filters, keys from metadata.FILTER_KEYS.
+                            category, clip and sample_rate take a value or a list of values,
+                            min_duration and max_duration are inclusive bounds in seconds
+
+        Returns:
+            list: List of tuples (feature_path, similarity_score), best first
+        """
+        paths, vectors, row_norms, _, partitions, row_lookup, row_ranges, removed_rows, delta = self._snapshot()
+        results = []
+        if vectors is not None:
+            if filters:
+                rows = self._resolve_rows(filters, partitions, row_lookup, len(paths))
+            else:
+                rows = slice(0, len(paths))
+            # A slice scores a view of the partition, an id array gathers only the matching rows
+            scores = self._score(query_vector, vectors[rows], row_norms[rows],
+                                 None if row_ranges is None else row_ranges[rows])
+            if isinstance(rows, slice):
+                hidden = removed_rows[(removed_rows >= rows.start) & (removed_rows < rows.stop)] - rows.start
+                row_ids = range(rows.start, rows.stop)
+            else:
+                hidden = np.flatnonzero(np.isin(rows, removed_rows, assume_unique=True))
+                row_ids = rows
+            # Rows replaced or removed since the last merge never match
+            scores[hidden] = -np.inf
+            results = [(paths[row_ids[row]], score) for row, score in top_rows(scores, top_n) if score > -np.inf]
+        if delta is not None:
+            results = sorted(results + delta.search(query_vector, top_n, filters), key=lambda x: x[1], reverse=True)
+        return results[:top_n]
+
+
+def group_rows(values):
+    """
+    Sorted row ids of each distinct value in a metadata column.
+
+    Returns:
+        dict: value -> np.ndarray of row ids
+    """
+    order = np.argsort(values, kind='stable')
+    sorted_values = values[order]
+    boundaries = np.flatnonzero(sorted_values[1:] != sorted_values[:-1]) + 1
+    starts = np.concatenate([[0], boundaries]).astype(np.int64)
+    stops = np.concatenate([boundaries, [len(values)]]).astype(np.int64)
+    return {
+        sorted_values[start].item(): order[start:stop]
+        for start, stop in zip(starts, stops) if stop > start
+    }
+
+
+def build_row_lookup(columns):
+    """
+    Precomputed lookups for search filters: row ids per clip number and per
+    sample rate, and the rows with a known duration sorted by duration.
+    """
+    durations = columns['duration']
+    order = np.argsort(durations, kind='stable')
+    order = order[np.isfinite(durations[order])]
+    return {
+        'clip': group_rows(columns['clip']),
+        'sample_rate': group_rows(columns['sample_rate']),
+        'duration': (durations[order], order),
+    }
+
+
+def intersect_rows(rows, ids):
+    """
+    Restrict `rows` (a slice or a sorted row id array) to the sorted row ids `ids`.
+    """
+    if isinstance(rows, slice):
+        return ids[(ids >= rows.start) & (ids < rows.stop)]
+    return np.intersect1d(rows, ids, assume_unique=True)
+
+
+def top_rows(scores, top_n):
+    """
+    Rows of the `top_n` highest scores as (row, score) tuples, best first.
+    """
+    top_n = min(top_n, len(scores))
+    if top_n <= 0:
+        return []
+    rows = np.argpartition(-scores, top_n - 1)[:top_n]
+    rows = rows[np.argsort(-scores[rows], kind='stable')]
+    return [(int(row), float(scores[row])) for row in rows]
+
+
+def quantization_report(json_files, k=5, n_queries=100, rescore=20, seed=0):
+    """
+    Compare each storage type against the float64 baseline.
+    Queries are corpus vectors sampled with a fixed seed, and each query's own
+    row is left out of both rankings so it can't count as a trivial hit.
+    recall@k is the fraction of the exact top k found by the compact index,
+    with and without an exact re-score of its top `rescore` candidates.
+
+    Returns:
+        list: One dict per storage type with memory and recall figures
+    """
+    baseline = VectorIndex('float64')
+    baseline.build(json_files)
+    matrix = baseline.vectors
+    rng = np.random.default_rng(seed)
+    queries = rng.choice(len(baseline), size=min(n_queries, len(baseline)), replace=False)
+
+    def neighbour_scores(index, q):
+        scores = index.score(matrix[q])
+        scores[q] = -np.inf
+        return scores
+
+    # At most len - 1 neighbours exist once the query row is excluded
+    k_found = min(k, len(baseline) - 1)
+    exact_scores = [neighbour_scores(baseline, q) for q in queries]
+    exact = [set(row for row, _ in top_rows(scores, k_found)) for scores in exact_scores]
+
+    report = []
+    for storage in STORAGE_TYPES:
+        index = VectorIndex(storage)
+        index.set_vectors(baseline.paths, matrix)
+        hits = 0
+        hits_rescored = 0
+        for q, expected, baseline_scores in zip(queries, exact, exact_scores):
+            scores = neighbour_scores(index, q)
+            hits += len(expected & set(row for row, _ in top_rows(scores, k_found)))
+            candidates = [row for row, _ in top_rows(scores, max(k_found, rescore))]
+            best = [candidates[i] for i, _ in top_rows(baseline_scores[candidates], k_found)]
+            hits_rescored += len(expected & set(best))
+        total = len(queries) * k_found
+        report.append({
+            'storage': storage,
+            'bytes': index.nbytes,
+            'savings': 1 - index.nbytes / baseline.nbytes,
+            'recall_at_k': hits / total if total > 0 else 1.0,
+            'recall_at_k_rescored': hits_rescored / total if total > 0 else 1.0,
+        })
+    return report
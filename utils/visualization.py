@@ -0,0 +1,247 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import librosa
+
+# Samples per peak bucket, finest first. Each level must divide the next one
+# so coarser levels can be reduced from the finer ones.
+PEAK_BUCKET_SIZES = [256, 1024, 4096, 16384]
+
+VISUALIZATION_DIR = 'visualization'
+
+# Summaries kept in memory per server process
+CACHE_SIZE = 512
+
+# Log-spaced bands the frequency distribution is averaged into when served
+SPECTRUM_BANDS = 64
+
+
+def compute_peaks(y, bucket_size):
+    """
+    Compute min/max amplitude for each bucket of `bucket_size` samples.
+
+    Returns:
+        np.ndarray: float32 array of shape (n_buckets, 2) holding [min, max]
+    """
+    n_buckets = int(np.ceil(len(y) / bucket_size))
+    if n_buckets == 0:
+        return np.zeros((0, 2), dtype=np.float32)
+    # Pad with the last sample so the tail bucket is not skewed towards zero
+    padded = np.pad(y, (0, n_buckets * bucket_size - len(y)), mode='edge')
+    frames = padded.reshape(n_buckets, bucket_size)
+    return np.stack([frames.min(axis=1), frames.max(axis=1)], axis=1).astype(np.float32)
+
+
+def reduce_peaks(peaks, factor):
+    """
+    Merge every `factor` consecutive buckets of a finer peak level into one.
+    """
+    n_buckets = int(np.ceil(len(peaks) / factor))
+    if n_buckets == 0:
+        return peaks
+    padded = np.pad(peaks, ((0, n_buckets * factor - len(peaks)), (0, 0)), mode='edge')
+    frames = padded.reshape(n_buckets, factor, 2)
+    return np.stack([frames[:, :, 0].min(axis=1), frames[:, :, 1].max(axis=1)], axis=1)
+
+
+def compute_peak_levels(y, bucket_sizes=PEAK_BUCKET_SIZES):
+    """
+    Compute the multi-resolution peak arrays. Only the finest level touches
+    the raw signal, every other level is reduced from the previous one.
+
+    Returns:
+        dict: bucket size -> (n_buckets, 2) peak array
+    """
+    levels = {}
+    previous_size = bucket_sizes[0]
+    peaks = compute_peaks(y, previous_size)
+    levels[previous_size] = peaks
+    for bucket_size in bucket_sizes[1:]:
+        if bucket_size % previous_size != 0:
+            raise ValueError(f"Bucket size {bucket_size} is not a multiple of {previous_size}")
+        peaks = reduce_peaks(peaks, bucket_size // previous_size)
+        levels[bucket_size] = peaks
+        previous_size = bucket_size
+    return levels
+
+
+def compute_frequency_distribution(magnitude_spectrum):
+    """
+    Average a magnitude spectrogram across time to get a frequency distribution.
+    """
+    return np.mean(magnitude_spectrum, axis=1).astype(np.float32)
+
+
+def get_band_edges(sr, n_fft, n_bands=SPECTRUM_BANDS):
+    """
+    Edges in Hz of `n_bands` log-spaced bands from the first non-DC bin to Nyquist.
+    """
+    return np.geomspace(sr / n_fft, sr / 2, n_bands + 1)
+
+
+def reduce_spectrum(frequency_distribution, sr, n_fft, n_bands=SPECTRUM_BANDS):
+    """
+    Average the per-bin frequency distribution into log-spaced bands.
+    Low bands narrower than one bin take the value interpolated at their center.
+
+    Returns:
+        tuple: (band edges in Hz, float32 array of one level per band)
+    """
+    edges = get_band_edges(sr, n_fft, n_bands)
+    frequencies = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
+    frequency_distribution = np.asarray(frequency_distribution, dtype=np.float64)
+    # Band of each bin, the DC bin falls below the first edge and Nyquist into the last band
+    bands = np.minimum(np.searchsorted(edges, frequencies, 'right') - 1, n_bands - 1)
+    in_range = bands >= 0
+    counts = np.bincount(bands[in_range], minlength=n_bands)
+    sums = np.bincount(bands[in_range], weights=frequency_distribution[in_range], minlength=n_bands)
+    centers = np.sqrt(edges[:-1] * edges[1:])
+    levels = np.interp(centers, frequencies, frequency_distribution)
+    levels[counts > 0] = sums[counts > 0] / counts[counts > 0]
+    return edges, levels.astype(np.float32)
+
+
+def build_visualization(features):
+    """
+    Build the visualization summary from the output of `extractFeature`,
+    reusing its signal and magnitude spectrogram instead of reloading the audio.
+    """
+    y = features['signal']
+    bucket_sizes = np.array(PEAK_BUCKET_SIZES, dtype=np.int32)
+    data = {
+        'sr': np.int32(features['sr']),
+        'n_samples': np.int64(len(y)),
+        'n_fft': np.int32(features['n_fft']),
+        'bucket_sizes': bucket_sizes,
+        'frequency_distribution': compute_frequency_distribution(features['magnitude_spectrum']),
+    }
+    for bucket_size, peaks in compute_peak_levels(y, PEAK_BUCKET_SIZES).items():
+        data[f'peaks_{bucket_size}'] = peaks
+    return data
+
+
+def build_visualization_from_file(wav_path, n_fft=2048, hop_length=160):
+    """
+    Build the visualization summary of a file that was ingested before the
+    store existed. Only decodes the signal and computes one STFT, with the
+    same parameters as `extractFeature`.
+    """
+    y, sr = librosa.load(wav_path, sr=None)
+    return build_visualization({
+        'signal': y,
+        'sr': sr,
+        'n_fft': n_fft,
+        'magnitude_spectrum': np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length)),
+    })
+
+
+def get_visualization_path(directory_path, wav_path):
+    """
+    Path of the stored summary for `wav_path`, mirroring the dataset layout
+    inside the visualization directory.
+    """
+    rel_path = os.path.relpath(wav_path, directory_path)
+    return os.path.join(directory_path, VISUALIZATION_DIR, os.path.splitext(rel_path)[0] + '.npz')
+
+
+def save_visualization(file_path, data):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    np.savez_compressed(file_path, **data)
+
+
+def load_visualization(file_path):
+    with np.load(file_path) as npz:
+        return {key: npz[key] for key in npz.files}
+
+
+def select_peak_level(data, max_buckets):
+    """
+    Pick the finest peak level that has at most `max_buckets` buckets,
+    falling back to the coarsest level.
+    """
+    bucket_sizes = [int(b) for b in data['bucket_sizes']]
+    for bucket_size in bucket_sizes:
+        if len(data[f'peaks_{bucket_size}']) <= max_buckets:
+            return bucket_size
+    return bucket_sizes[-1]
+
+
+def visualization_to_json(data, max_buckets=2000, n_bands=SPECTRUM_BANDS):
+    """
+    Convert a stored summary into a JSON-serializable payload with a single
+    peak level suited to `max_buckets` display columns and the frequency
+    distribution averaged into `n_bands` log-spaced bands.
+    """
+    bucket_size = select_peak_level(data, max_buckets)
+    peaks = data[f'peaks_{bucket_size}']
+    sr = int(data['sr'])
+    n_fft = int(data['n_fft'])
+    band_edges, band_levels = reduce_spectrum(data['frequency_distribution'], sr, n_fft, n_bands)
+    return {
+        'sample_rate': sr,
+        'n_fft': n_fft,
+        'duration': int(data['n_samples']) / sr,
+        'bucket_size': bucket_size,
+        'peaks_min': np.round(peaks[:, 0], 4).tolist(),
+        'peaks_max': np.round(peaks[:, 1], 4).tolist(),
+        'band_edges': np.round(band_edges, 2).tolist(),
+        'frequency_distribution': np.round(band_levels, 6).tolist(),
+    }
+
+
+def visualization_to_bytes(data, max_buckets=2000, n_bands=SPECTRUM_BANDS):
+    """
+    Raw little-endian float32 payload: the interleaved [min, max] peaks of the
+    selected level followed by the `n_bands` band levels of the frequency
+    distribution. Band edges follow from get_band_edges(sample rate, n_fft, n_bands).
+
+    Returns:
+        tuple: (dict of values describing the payload, bytes)
+    """
+    bucket_size = select_peak_level(data, max_buckets)
+    peaks = data[f'peaks_{bucket_size}']
+    sr = int(data['sr'])
+    n_fft = int(data['n_fft'])
+    _, band_levels = reduce_spectrum(data['frequency_distribution'], sr, n_fft, n_bands)
+    layout = {
+        'sample_rate': sr,
+        'n_fft': n_fft,
+        'bucket_size': bucket_size,
+        'peak_count': len(peaks),
+        'band_count': n_bands,
+    }
+    return layout, peaks.astype('<f4').tobytes() + band_levels.astype('<f4').tobytes()
+
+
+class VisualizationCache:
+    """
+    Thread-safe LRU cache of loaded summaries, holding at most `max_size` entries.
+    """
+
+    def __init__(self, max_size=CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, data):
+        with self.lock:
+            self.entries[key] = data
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -3,20 +3,62 @@ import utils.pre_processing as pre_processing
 import numpy as np
 import utils.extract_features as extract_features
 import utils.utils as utils
+import utils.visualization as visualization
+import utils.vector_index as vector_index
+import utils.metadata as metadata
 import json
 import os
+import threading
+import time
 from tqdm import tqdm
 
+# Directories written inside the dataset directory, never scanned as input
+DERIVED_DIRS = ('normalized_features', visualization.VISUALIZATION_DIR, metadata.METADATA_DIR)
+
+
+def extract_query_vector(directory_path, file_path):
+    """
+    Extract the normalized feature vector of an uploaded file.
+    Module level so it can run in a separate process (see utils.process_pool).
+    """
+    agent = Worker(directory_path)
+    return agent.convert_dict_to_array(agent.get_normalized_test_feature(file_path))
+
 
 class Worker:
-    def __init__(self, directory_path):
+    def __init__(self, directory_path, storage='float32', rescore_top=0):
+        """
+        Args:
+            directory_path (str): Dataset directory
+            storage (str): Storage type of the in-memory vectors, one of vector_index.STORAGE_TYPES
+            rescore_top (int): Number of best candidates re-scored exactly from the feature files, 0 to disable
+        """
         self.directory_path = directory_path
+        self.storage = storage
+        self.rescore_top = rescore_top
+        # Normalized corpus vectors, loaded on first search
+        self.index = None
+        # Held while loading the index, so concurrent first searches wait for one load
+        self.index_lock = threading.Lock()
+        # Recently used visualization summaries keyed by WAV path
+        self.visualization_cache = visualization.VisualizationCache()
+        # Background watch mode, see start_watching
+        self.watch_stop = None
+        self.watch_thread = None
+        # Called after watch changed the index, e.g. to publish it to other processes
+        self.on_index_update = None
 
     def process_directory(self, directory_path):
         """
         Process all WAV files in the given directory and its subdirectories.
         For each WAV file, extract features and save them as a JSON file with the same name.
+        Waveform peaks and the frequency distribution are stored alongside in the visualization directory.
+        `directory_path` must be inside the dataset directory, so derived files stay under it.
         """
+        dataset_root = os.path.abspath(self.directory_path)
+        if os.path.commonpath([os.path.abspath(directory_path), dataset_root]) != dataset_root:
+            raise ValueError(f"{directory_path} is not inside the dataset directory {self.directory_path}")
+
     # First, collect all WAV files
         wav_files = []
         for root, dirs, files in os.walk(directory_path):
@@ -26,22 +68,44 @@ class Worker:
         
         # Process files with progress bar
         for wav_path in tqdm(wav_files, desc="Processing WAV files", unit="file"):
-            # Create the corresponding JSON file path
-            json_path = os.path.splitext(wav_path)[0] + '.json'
-            
             try:
-                # Extract features
-                features = extract_features.extractFeature(wav_path)
-                feature_dict = extract_features.aggreate_features(features)
-                
-                # Save to JSON
-                with open(json_path, 'w') as f:
-                    json.dump(feature_dict, f, indent=4)
-                
+                self.ingest_file(wav_path)
                 tqdm.write(f"✓ Processed: {os.path.basename(wav_path)}")
             except Exception as e:
                 tqdm.write(f"✗ Error processing {os.path.basename(wav_path)}: {str(e)}")
 
+    def ingest_file(self, wav_path):
+        """
+        Extract features of a single WAV file and save them as a JSON file with the same name,
+        together with its visualization summary and metadata.
+
+        Returns:
+            tuple: (aggregated, not normalized, feature values, file metadata dict)
+        """
+        # Create the corresponding JSON file path
+        json_path = os.path.splitext(wav_path)[0] + '.json'
+
+        # Extract features
+        features = extract_features.extractFeature(wav_path)
+        feature_dict = extract_features.aggreate_features(features)
+        
+        # Save to JSON
+        with open(json_path, 'w') as f:
+            json.dump(feature_dict, f, indent=4)
+
+        # Save visualization summary, reusing the decoded signal and spectrogram
+        visualization.save_visualization(
+            visualization.get_visualization_path(self.directory_path, wav_path),
+            visualization.build_visualization(features)
+        )
+
+        # Save metadata used by search filters, so loading the index needs no audio access
+        file_metadata = metadata.build_file_metadata(
+            self.directory_path, wav_path, len(features['signal']) / features['sr'], features['sr']
+        )
+        metadata.save_metadata(metadata.get_metadata_path(self.directory_path, self.get_rel_stem(wav_path)), file_metadata)
+        return feature_dict, file_metadata
+
     def normalize_features(self):
         """
         Normalize feature vectors across all JSON files in the directory.
@@ -53,9 +117,11 @@ class Worker:
         normalized_dir = os.path.join(self.directory_path, 'normalized_features')
         os.makedirs(normalized_dir, exist_ok=True)
 
-        # Collect all JSON files
+        # Collect all JSON files, skipping the ones derived from them
         json_files = []
         for root, dirs, files in os.walk(self.directory_path):
+            if root == self.directory_path:
+                dirs[:] = [d for d in dirs if d not in DERIVED_DIRS]
             for file in files:
                 if file.lower().endswith('.json'):
                     json_files.append(os.path.join(root, file))
@@ -155,16 +221,24 @@ class Worker:
         # Extract and aggregate features
         features = extract_features.extractFeature(test_file_path)
         feature_dict = extract_features.aggreate_features(features)
-        
+        return self.normalize_feature_dict(feature_dict, self.load_feature_stats())
+
+    def load_feature_stats(self):
+        """
+        Load the normalization coefficients saved by normalize_features.
+        """
         # Load normalization coefficients from configs.json
         configs_path = os.path.join(self.directory_path, 'normalized_features', 'configs.json')
         try:
             with open(configs_path, 'r') as f:
-                feature_stats = json.load(f)
+                return json.load(f)
         except Exception as e:
             raise Exception(f"Error loading normalization coefficients: {str(e)}")
-        
-        # Normalize features using saved coefficients
+
+    def normalize_feature_dict(self, feature_dict, feature_stats):
+        """
+        Normalize aggregated feature values using saved coefficients.
+        """
         normalized_data = {}
         for feature_name, value in feature_dict.items():
             if feature_name not in feature_stats:
@@ -194,51 +268,362 @@ class Worker:
         test = np.array(all_values)
         return test
     
-    def find_similar_files(self, input_file_path, top_n=5):
+    def get_normalized_feature_files(self):
+        """
+        Collect all normalized feature JSON files of the dataset.
+        """
+        normalized_dir = os.path.join(self.directory_path, 'normalized_features')
+        json_files = []
+        for root, dirs, files in os.walk(normalized_dir):
+            if root == normalized_dir:
+                # Left behind by normalize_features runs that also normalized their own output
+                dirs[:] = [d for d in dirs if d not in DERIVED_DIRS]
+            for file in files:
+                if file.lower().endswith('.json') and file != 'configs.json':
+                    json_files.append(os.path.join(root, file))
+        return json_files
+
+    def get_rel_stem(self, wav_path):
+        """
+        Path of a dataset WAV file relative to the dataset directory, without extension.
+        """
+        return os.path.splitext(os.path.relpath(wav_path, self.directory_path))[0]
+
+    def load_file_metadata(self, feature_path):
+        """
+        Metadata of the file a normalized feature JSON was computed from.
+        Files ingested before metadata was saved get it from their WAV header once.
+
+        Returns:
+            dict: Metadata as built by metadata.build_file_metadata, or None when the WAV file is gone
+        """
+        normalized_dir = os.path.join(self.directory_path, 'normalized_features')
+        rel_stem = os.path.splitext(os.path.relpath(feature_path, normalized_dir))[0]
+        metadata_path = metadata.get_metadata_path(self.directory_path, rel_stem)
+        file_metadata = metadata.load_metadata(metadata_path)
+        if file_metadata is None:
+            wav_path = metadata.find_wav_file(self.directory_path, rel_stem)
+            if wav_path is None:
+                return None
+            file_metadata = metadata.get_file_metadata(self.directory_path, wav_path)
+            metadata.save_metadata(metadata_path, file_metadata)
+        return file_metadata
+
+    def wav_to_feature_path(self, wav_path):
+        """
+        Map an original WAV file path to its normalized feature JSON path.
+        """
+        rel_path = os.path.relpath(wav_path, self.directory_path)
+        return os.path.join(self.directory_path, 'normalized_features', os.path.splitext(rel_path)[0] + '.json')
+
+    def load_index(self):
+        """
+        Load all normalized feature vectors into memory using the configured storage type,
+        together with the metadata used by search filters. Rows are keyed by the path of
+        the WAV file recorded in the metadata; feature files whose WAV file is gone are skipped.
+        """
+        json_files = []
+        wav_paths = []
+        rows_metadata = []
+        for file_path in self.get_normalized_feature_files():
+            file_metadata = self.load_file_metadata(file_path)
+            wav_path = None
+            if file_metadata is not None:
+                wav_path = os.path.normpath(os.path.join(self.directory_path, file_metadata['wav_path']))
+            if wav_path is None or not os.path.exists(wav_path):
+                tqdm.write(f"Warning: no WAV file for {file_path}, not indexed")
+                continue
+            json_files.append(file_path)
+            wav_paths.append(wav_path)
+            rows_metadata.append(file_metadata)
+        # Assign only once built, so searches never see a partly loaded index
+        index = vector_index.VectorIndex(self.storage)
+        index.build(json_files, rows_metadata, wav_paths)
+        self.index = index
+
+    def get_index(self):
+        """
+        The in-memory index, loaded on first use. Concurrent first calls wait for a single load.
+        """
+        index = self.index
+        if index is None:
+            with self.index_lock:
+                if self.index is None:
+                    self.load_index()
+                index = self.index
+        return index
+
+    def get_categories(self):
+        """
+        Number of indexed files per category (topic directory), usable as a search filter.
+        """
+        return self.get_index().categories()
+
+    def find_similar_files(self, input_file_path, top_n=5, filters=None):
         """
         Find the top N most similar files to the input file based on feature similarity.
         
         Args:
             input_file_path (str): Path to the input WAV file
             top_n (int): Number of similar files to return
+            filters (dict): Optional metadata filters, see vector_index.VectorIndex.search
             
         Returns:
-            list: List of tuples (file_path, similarity_score) for the top N most similar files
+            list: List of tuples (file_path, similarity_score) for the top N most similar files.
+                  Scores come from the in-memory index unless rescore_top is set.
         """
         # Get normalized features for the input file
         input_features = self.get_normalized_test_feature(input_file_path)
         input_vector = self.convert_dict_to_array(input_features)
-        
-        # Directory containing normalized features
-        normalized_dir = os.path.join(self.directory_path, 'normalized_features')
-        
-        # Store similarity scores
+        return self.find_similar_vector(input_vector, top_n, filters)
+
+    def find_similar_vector(self, input_vector, top_n=5, filters=None):
+        """
+        Find the top N most similar files to an already normalized feature vector.
+
+        Args:
+            input_vector (np.ndarray): Normalized feature vector, e.g. from extract_query_vector
+            top_n (int): Number of similar files to return
+            filters (dict): Optional metadata filters, see vector_index.VectorIndex.search
+
+        Returns:
+            list: List of tuples (file_path, similarity_score) for the top N most similar files
+        """
+        index = self.get_index()
+
+        if not self.rescore_top:
+            return index.search(input_vector, top_n, filters)
+
+        # Re-score the best candidates exactly from the float features on disk
         similarity_scores = []
-        
-        # Collect all JSON files first
-        json_files = []
-        for root, dirs, files in os.walk(normalized_dir):
-            for file in files:
-                if file.lower().endswith('.json') and file != 'configs.json':
-                    json_files.append(os.path.join(root, file))
-        
-        # Read and compare with all normalized feature files with progress bar
-        for file_path in tqdm(json_files, desc="Comparing files", unit="file"):
+        for wav_path, _ in index.search(input_vector, max(top_n, self.rescore_top), filters):
             try:
-                compare_vector = utils.getFeatureFromJSON(file_path)
-                
+                compare_vector = utils.getFeatureFromJSON(self.wav_to_feature_path(wav_path))
                 similarity = utils.findCosinSimilarity(input_vector, compare_vector)
-                
-                # # Store original WAV file path (remove .json extension and normalized_features part)
-                original_path = os.path.relpath(file_path, normalized_dir)
-                original_path = os.path.splitext(original_path)[0] + '.wav'
-                original_path = os.path.join(self.directory_path, original_path)
-                print(compare_vector.shape," : ", original_path)
-                similarity_scores.append((original_path, similarity))
-                
+                similarity_scores.append((wav_path, similarity))
             except Exception as e:
-                tqdm.write(f"Error processing {os.path.basename(file_path)}: {str(e)}")
+                tqdm.write(f"Error processing {os.path.basename(wav_path)}: {str(e)}")
         
         # Sort by similarity score in descending order and get top N
         similarity_scores.sort(key=lambda x: x[1], reverse=True)
         return similarity_scores[:top_n]
+
+    def get_visualization(self, wav_path):
+        """
+        Get the waveform peaks and frequency distribution summary of a dataset file.
+        Summaries are read from the visualization directory and the most recently used
+        ones kept in memory; files processed before the store existed are summarized on
+        first request from their signal and spectrogram only.
+
+        Args:
+            wav_path (str): Path to a WAV file inside the dataset directory
+
+        Returns:
+            dict: Summary arrays as produced by visualization.build_visualization
+        """
+        key = os.path.abspath(wav_path)
+        data = self.visualization_cache.get(key)
+        if data is not None:
+            return data
+
+        file_path = visualization.get_visualization_path(self.directory_path, wav_path)
+        if os.path.exists(file_path):
+            data = visualization.load_visualization(file_path)
+        else:
+            data = visualization.build_visualization_from_file(wav_path)
+            visualization.save_visualization(file_path, data)
+
+        self.visualization_cache.put(key, data)
+        return data
+
+    def scan_wav_files(self):
+        """
+        Snapshot of all WAV files in the dataset directory.
+
+        Returns:
+            dict: WAV path -> (modification time in ns, size in bytes)
+        """
+        snapshot = {}
+        for root, dirs, files in os.walk(self.directory_path):
+            if root == self.directory_path:
+                dirs[:] = [d for d in dirs if d not in DERIVED_DIRS]
+            for file in files:
+                if file.lower().endswith('.wav'):
+                    wav_path = os.path.normpath(os.path.join(root, file))
+                    try:
+                        stat = os.stat(wav_path)
+                    except OSError:
+                        # Removed between listing and stat
+                        continue
+                    snapshot[wav_path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def is_feature_outdated(self, wav_path, signature):
+        """
+        Whether a WAV file was modified after its normalized features were written,
+        e.g. while nothing was watching.
+
+        Args:
+            wav_path (str): Path of the WAV file
+            signature (tuple): (modification time in ns, size) from scan_wav_files
+        """
+        try:
+            return os.stat(self.wav_to_feature_path(wav_path)).st_mtime_ns < signature[0]
+        except OSError:
+            return True
+
+    def apply_changes(self, changed_files, removed_files):
+        """
+        Bring the feature files and the in-memory index up to date for a batch of changes.
+        New or modified files are extracted and normalized with the saved coefficients,
+        removed files are dropped from the index together with the files derived from them.
+
+        Args:
+            changed_files (list): WAV paths that were added or modified
+            removed_files (list): WAV paths that were deleted
+
+        Returns:
+            list: WAV paths that could not be processed and should be retried
+        """
+        index = self.get_index()
+        feature_stats = self.load_feature_stats() if changed_files else None
+
+        wav_paths = []
+        vectors = []
+        rows_metadata = []
+        failed = []
+        for wav_path in tqdm(changed_files, desc="Indexing changed files", unit="file"):
+            try:
+                feature_dict, file_metadata = self.ingest_file(wav_path)
+                normalized_data = self.normalize_feature_dict(feature_dict, feature_stats)
+
+                feature_path = self.wav_to_feature_path(wav_path)
+                os.makedirs(os.path.dirname(feature_path), exist_ok=True)
+                with open(feature_path, 'w') as f:
+                    json.dump(normalized_data, f, indent=4)
+
+                vectors.append(utils.getFeatureFromJSON(feature_path))
+                wav_paths.append(wav_path)
+                rows_metadata.append(file_metadata)
+                self.visualization_cache.pop(os.path.abspath(wav_path))
+                tqdm.write(f"\u2713 Indexed: {os.path.basename(wav_path)}")
+            except Exception as e:
+                failed.append(wav_path)
+                tqdm.write(f"\u2717 Error indexing {os.path.basename(wav_path)}: {str(e)}")
+
+        for wav_path in removed_files:
+            try:
+                self.remove_derived_files(wav_path)
+                tqdm.write(f"\u2713 Removed: {os.path.basename(wav_path)}")
+            except Exception as e:
+                tqdm.write(f"\u2717 Error removing files of {os.path.basename(wav_path)}: {str(e)}")
+            self.visualization_cache.pop(os.path.abspath(wav_path))
+
+        matrix = np.array(vectors, dtype=np.float64).reshape(len(vectors), len(index.sqrt_weights))
+        index.update(wav_paths, matrix, removed_files, rows_metadata)
+        return failed
+
+    def remove_derived_files(self, wav_path):
+        """
+        Delete the feature, visualization and metadata files of a deleted WAV file.
+        Files are only deleted when the saved metadata shows they were computed from
+        this exact WAV path, e.g. not when "X.WAV" is deleted but "X.wav" remains.
+        """
+        rel_stem = self.get_rel_stem(wav_path)
+        metadata_path = metadata.get_metadata_path(self.directory_path, rel_stem)
+        file_metadata = metadata.load_metadata(metadata_path)
+        rel_path = os.path.relpath(wav_path, self.directory_path).replace('\\', '/')
+        if file_metadata is None or file_metadata['wav_path'] != rel_path:
+            return
+        for path in (
+            os.path.splitext(wav_path)[0] + '.json',
+            self.wav_to_feature_path(wav_path),
+            visualization.get_visualization_path(self.directory_path, wav_path),
+            metadata_path
+        ):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def watch(self, interval=1.0, debounce=2.0, stop_event=None, retry_delay=30.0):
+        """
+        Poll the dataset directory and keep the index live as WAV files are added,
+        modified or removed. Changes are collected until the directory has been quiet
+        for `debounce` seconds, then applied as one batch. Files that fail to process
+        are retried after `retry_delay` seconds, or sooner if they change again.
+
+        On start, files added or modified while nothing was watching are indexed, and
+        rows whose WAV file is gone are dropped from the index only; no file is deleted for them.
+
+        Args:
+            interval (float): Seconds between directory scans
+            debounce (float): Quiet period in seconds before a batch is applied
+            stop_event (threading.Event): Set to stop watching
+            retry_delay (float): Seconds before failed files are retried
+        """
+        if stop_event is None:
+            stop_event = threading.Event()
+        index = self.get_index()
+
+        snapshot = self.scan_wav_files()
+        indexed = set(index.indexed_paths())
+        stale = sorted(indexed - set(snapshot))
+        if stale:
+            index.update([], np.zeros((0, len(index.sqrt_weights))), stale)
+            self.index_updated()
+            tqdm.write(f"Dropped {len(stale)} index rows without a WAV file")
+        changed = set(
+            path for path, signature in snapshot.items()
+            if path not in indexed or self.is_feature_outdated(path, signature)
+        )
+        removed = set()
+        last_change = float('-inf') if changed else None
+
+        while True:
+            if last_change is not None and time.monotonic() - last_change >= debounce:
+                try:
+                    failed = self.apply_changes(sorted(changed), sorted(removed))
+                    self.index_updated()
+                    changed, removed = set(failed), set()
+                except Exception as e:
+                    # Keep the whole batch, e.g. when configs.json can't be read
+                    tqdm.write(f"\u2717 Error applying changes: {str(e)}")
+                # Pending (failed) paths wait for retry_delay unless they change again
+                last_change = time.monotonic() + retry_delay - debounce if changed or removed else None
+
+            if stop_event.wait(interval):
+                return
+
+            current = self.scan_wav_files()
+            for path, signature in current.items():
+                # Files still being written keep changing size and mtime, which restarts the quiet period
+                if snapshot.get(path) != signature:
+                    changed.add(path)
+                    removed.discard(path)
+                    last_change = time.monotonic()
+            for path in snapshot.keys() - current.keys():
+                removed.add(path)
+                changed.discard(path)
+                last_change = time.monotonic()
+            snapshot = current
+
+    def index_updated(self):
+        if self.on_index_update is not None:
+            self.on_index_update()
+
+    def start_watching(self, interval=1.0, debounce=2.0, retry_delay=30.0):
+        """
+        Run watch in a background thread until stop_watching is called.
+        """
+        self.watch_stop = threading.Event()
+        self.watch_thread = threading.Thread(
+            target=self.watch,
+            args=(interval, debounce, self.watch_stop, retry_delay),
+            daemon=True
+        )
+        self.watch_thread.start()
+
+    def stop_watching(self):
+        if self.watch_thread is not None:
+            self.watch_stop.set()
+            self.watch_thread.join()
+            self.watch_thread = None